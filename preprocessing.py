@@ -59,10 +59,35 @@ First method: PCA.
 import cv2 as cv
 import numpy as np
 import math
+import multiprocessing
+import os
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+# PyTurboJPEG is optional; without it (or its libjpeg-turbo library) JPEGs
+# are decoded by cv.imread.
+try:
+    from turbojpeg import TurboJPEG, TJPF_GRAY
+    _TJ = TurboJPEG()
+except (ImportError, RuntimeError):
+    _TJ = None
+
+# Run OpenCV operations on the OpenCL device (cv.UMat) when DR_USE_OCL=1.
+USE_OCL = os.environ.get("DR_USE_OCL") == "1"
+if USE_OCL:
+    cv.ocl.setUseOpenCL(True)
 
 # Standard resolution of images after processing.
 STD_RES = 512
 
+# Batch run parameters.
+CHUNK_SIZE = 16  # Images handed to a worker process at a time.
+PREFETCH = 4  # Images a worker decodes ahead of the one it is processing.
+
+# Subdirectory, next to the images, where load_image keeps its cache.
+CACHE_DIR = ".preprocessed"
+
 # Thresholding parameter.
 THRESH = 30  # For edge detection
 
@@ -78,6 +103,7 @@ P1 = 140
 P2 = 30
 MIN_R = int(STD_RES * 0.4)
 MAX_R = STD_RES
+HOUGH_SCALE = 2  # Hough runs on the image shrunk by this factor.
 
 # Blob detection parameters (for notch detection).
 BLOB_PARAMS = cv.SimpleBlobDetector_Params()
@@ -91,17 +117,58 @@ BLOB_PARAMS.filterByInertia = True
 BLOB_PARAMS.minInertiaRatio = 0.05
 BLOB_PARAMS.maxInertiaRatio = 1
 
+# Detector and structuring element shared by every notch detection call.
+_SBD = cv.SimpleBlobDetector_create(BLOB_PARAMS)
+_KERNEL3 = np.ones((3, 3), np.uint8)
+
+# Per-thread scratch arrays reused from one image to the next (see _buf).
+_BUFFERS = threading.local()
+
+# Decoding threads of a batch worker process, started by _init_worker.
+_DECODER = None
 
-def preprocess_image(path):
+
+def _buf(name, shape, dtype=np.uint8):
+    """
+    Returns the scratch array for a named pipeline stage, reusing the one from
+    the previous call in this thread when shape and dtype still match. Only one
+    array is kept per stage so varying input sizes don't pile up in memory.
+    """
+    cache = getattr(_BUFFERS, "cache", None)
+    if cache is None:
+        cache = _BUFFERS.cache = {}
+
+    buf = cache.get(name)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = cache[name] = np.empty(shape, dtype)
+    return buf
+
+
+def _as_array(img):
+    """ Downloads a UMat to host memory; ndarrays are returned untouched. """
+    return img.get() if isinstance(img, cv.UMat) else img
+
+
+def _roi(img, x, y, w, h):
+    """ Region of interest view into either an ndarray or a UMat. """
+    if isinstance(img, cv.UMat):
+        return cv.UMat(img, (y, y + h), (x, x + w))
+    return img[y:y + h, x:x + w]
+
+
+def preprocess_image(path, img_in=None):
     """
     Loads an image, converts to grayscale, flips the image if necessary based
     on which eye it is and if there is a notch present, and equalizes the
-    image's histogram.
+    image's histogram. The returned array is a reused buffer and will be
+    overwritten by the next call in the same thread.
     :param str path: Path to an image.
+    :param np.ndarray img_in: The image already decoded by read_image, if any.
     :rtype: numpy.ndarray
     """
-    # Loading the image also converts it to grayscale.
-    img = load_image(path)
+    # Loading the image also converts it to grayscale. This is the image that
+    # gets saved, so downscale it with the higher quality interpolation.
+    img = load_image(path, interp=cv.INTER_AREA, img_in=img_in)
     img_thresh = threshold(img)
 
     # Two-part notch-detection. Notch could be in upper-right quadrant, or it
@@ -129,137 +196,345 @@ def preprocess_image(path):
     return img
 
 
-def load_image(path, grayscale=True, equalize=False, resize=True):
+def load_image(path, grayscale=True, equalize=False, resize=True,
+               interp=cv.INTER_LINEAR, img_in=None, cache=False, shrink=False):
     """
     Loads an image, transforms it to grayscale, and resizes it. Optionally
     equalizes the image's histogram. Equalization seems to play poorly with
-    preprocessing however, so by default it is turned off.
+    preprocessing however, so by default it is turned off. When resizing, the
+    returned array is a reused buffer and will be overwritten by the next call
+    in the same thread. With DR_USE_OCL=1 the image is returned as a cv.UMat
+    so the rest of the pipeline stays on the OpenCL device.
     :param path: Path to the image file.
     :param grayscale: Flag for converting image to grayscale.
     :param equalize: Flag for equalizing the image's histogram.
     :param resize: Flag for resizing the image to standard resolution.
-    :rtype: np.ndarray
+    :param interp: Interpolation used when resizing. INTER_LINEAR is plenty
+        for thresholding and Hough; INTER_AREA is slower but looks better.
+    :param img_in: The image already decoded by read_image, if any. It must
+        have been decoded with the same grayscale flag.
+    :param cache: Flag for keeping the result in a .npy file under CACHE_DIR
+        and loading it from there on later calls, skipping the decode.
+    :param shrink: Flag for letting read_image shrink JPEGs while decoding
+        when resizing. Faster, but the result then depends on whether
+        libjpeg-turbo is installed, so the batch output leaves it off.
+    :rtype: np.ndarray | cv.UMat
     """
 
-    img_in = cv.imread(path, cv.IMREAD_GRAYSCALE if grayscale else -1)
+    cache_path = None
+    if cache:
+        # Everything that changes the result goes into the file name: the
+        # source file's size and modification time, the parameters, and
+        # whether the image was really shrunk during decode, which needs
+        # libjpeg-turbo. The files live in their own directory so they can't
+        # be mistaken for images by anything listing the image directory.
+        stat = os.stat(path)
+        cache_dir = os.path.join(os.path.dirname(path), CACHE_DIR)
+        cache_name = "{}.{:d}-{:d}.{}-{}-{:d}{:d}{:d}{:d}-{}.npy".format(
+            os.path.basename(path), stat.st_size, int(stat.st_mtime),
+            STD_RES, THRESH, grayscale, equalize, resize,
+            shrink and _TJ is not None, interp)
+        cache_path = os.path.join(cache_dir, cache_name)
+        if os.path.exists(cache_path):
+            img_in = np.array(np.load(cache_path, mmap_mode="r"))
+            return cv.UMat(img_in) if USE_OCL else img_in
+
+    if img_in is None:
+        img_in = read_image(path, grayscale,
+                            STD_RES if resize and shrink else None)
+    if USE_OCL:
+        img_in = cv.UMat(img_in)
     if equalize:
         cv.equalizeHist(img_in, img_in)
 
     if resize:
-        img_in = bb_resize(img_in, threshold(img_in))
+        img_in = bb_resize(img_in, interp)
+
+    if cache_path is not None:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # Write to a temporary name and rename it into place, so a run that
+        # is interrupted can't leave a truncated file to be loaded later.
+        tmp_path = "{}.{}.tmp.npy".format(cache_path[:-len(".npy")],
+                                          os.getpid())
+        np.save(tmp_path, _as_array(img_in))
+        try:
+            os.rename(tmp_path, cache_path)
+        except OSError:
+            # On Windows rename won't replace a file that another process
+            # has written in the meantime. That one is just as good.
+            os.remove(tmp_path)
 
     return img_in
 
 
-def threshold(img):
-    """ Thresholds image according to global parameter. """
-    _, output = cv.threshold(img, THRESH, 255, cv.THRESH_BINARY)
+def read_image(path, grayscale=True, min_side=None):
+    """
+    Decodes an image file. Grayscale JPEGs are decoded by libjpeg-turbo when
+    PyTurboJPEG is installed, which goes straight to grayscale and can shrink
+    the image by 1/2, 1/4 or 1/8 while decoding.
+    :param str path: Path to the image file.
+    :param bool grayscale: Flag for decoding to grayscale.
+    :param int min_side: If given, shrink during decode while keeping the
+        short side at least twice this long. The margin is there because the
+        eye's bounding box can be a lot smaller than the frame.
+    :rtype: np.ndarray
+    """
+    if (_TJ is None or not grayscale or
+            not path.lower().endswith((".jpeg", ".jpg"))):
+        return cv.imread(path, cv.IMREAD_GRAYSCALE if grayscale else -1)
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    factor = 1
+    if min_side is not None:
+        short_side = min(_TJ.decode_header(data)[:2])
+        while factor < 8 and short_side // (factor * 4) >= min_side:
+            factor *= 2
+
+    img = _TJ.decode(data, pixel_format=TJPF_GRAY,
+                     scaling_factor=(1, factor))
+    return img.reshape(img.shape[:2])
+
+
+def threshold(img, buf_name="threshold"):
+    """
+    Thresholds image according to global parameter. The output is a reused
+    buffer and will be overwritten by the next call in the same thread that
+    uses the same buf_name.
+    """
+    output = None if isinstance(img, cv.UMat) else \
+        _buf(buf_name, img.shape, img.dtype)
+    _, output = cv.threshold(img, THRESH, 255, cv.THRESH_BINARY, dst=output)
     return output
 
 
 def hough_circles(img):
     """
     Apply Hough Circle Transform using global parameters and returns data in
-    a nice list-of-tuples format. If no circles are found, the empty list is
+    a nice list-of-lists format. If no circles are found, the empty list is
     returned.
     :param np.ndarray img: The image to search for circles.
-    :returns: List of tuples of the form (x, y, radius)
-    :rtype: list[(int, int, float)]
+    :returns: List of lists of the form [x, y, radius]
+    :rtype: list[list[int]]
     """
     global DP, MD, P1, P2, MIN_R, MAX_R
-    img = img.copy()
 
-    # Black out the NW, SW, and SE quadrants to force Hough detection to align
-    # to notch edge. This is done to hopefully reduce the amount of "edge" that
-    # is left over after subtraction.
+    # The accumulator grows with the image area, so search a downscaled copy
+    # first. That is only good to a few pixels, so each circle it finds is
+    # then searched for again at full resolution, but only over radii close
+    # to it. The cropping works on the host; the transforms themselves go back
+    # to the OpenCL device if that's where the image came from.
+    on_device = isinstance(img, cv.UMat)
+    scale = 1.0 / HOUGH_SCALE
+    small = cv.resize(img, None, fx=scale, fy=scale,
+                      interpolation=cv.INTER_LINEAR)
+
+    coarse = _hough_quadrant(small, MD // HOUGH_SCALE, MIN_R // HOUGH_SCALE,
+                             MAX_R // HOUGH_SCALE, on_device)
+    if coarse is None:
+        return []
+
+    # The coarse radius can be off by a couple of its accumulator cells.
+    band = HOUGH_SCALE * DP * 4
+    circles = []
+    for c in coarse * HOUGH_SCALE:
+        r = int(round(c[2]))
+        fine = _hough_quadrant(img, MD, max(r - band, 0), r + band, on_device)
+        if fine is not None:
+            # Keep the refined circle closest to the coarse one.
+            c = fine[np.abs(fine - c).sum(axis=1).argmin()]
+        circles.append(c)
+
+    # Round once here since the drawing functions only take integers.
+    return np.round(circles).astype(np.int32).tolist()
+
+
+def _hough_quadrant(img, min_dist, min_r, max_r, on_device=False):
+    """
+    Runs HoughCircles over the NE quadrant of an image, using the global
+    DP, P1 and P2.
+    :returns: N x 3 array of circles (x, y, radius) in img coordinates, or
+        None if none were found.
+    :rtype: np.ndarray
+    """
+    # Only search the NE quadrant to force Hough detection to align to notch
+    # edge. This is done to hopefully reduce the amount of "edge" that is left
+    # over after subtraction. The eyeball's center sits on the corner of that
+    # quadrant, so pad it with black toward the center; Hough can't report
+    # circles centered on the edge of its accumulator.
+    img = _as_array(img)
     h, w = img.shape
-    half_h, half_w = (int(h / 2), int(w / 2))
-    cv.rectangle(img, (0, 0), (half_w, h),
-                 (0, 0, 0), thickness=cv.FILLED)
-    cv.rectangle(img, (0, h), (w, half_h),
-                 (0, 0, 0), thickness=cv.FILLED)
-
-    circles = cv.HoughCircles(img, cv.HOUGH_GRADIENT, DP, MD,
+    half_h, half_w = (h // 2, w // 2)
+    margin = half_w // 2
+    img = cv.copyMakeBorder(img[0:half_h, half_w:w], 0, margin, margin, 0,
+                            cv.BORDER_CONSTANT, value=0)
+    if on_device:
+        img = cv.UMat(img)
+
+    circles = cv.HoughCircles(img, cv.HOUGH_GRADIENT, DP, min_dist,
                               param1=P1, param2=P2,
-                              minRadius=MIN_R, maxRadius=MAX_R)
+                              minRadius=min_r, maxRadius=max_r)
+    circles = _as_array(circles)
+    if circles is None:
+        return None
 
-    output = []
-    if circles is not None:
-        circles = circles[0]  # Why are tuples buried like this? Bug?
-        for c in circles[0:]:
-            output.append((c[0], c[1], c[2]))
+    # Circles come back wrapped in an extra (1, N, 3) dimension. Shift them
+    # from the padded quadrant back into the full image.
+    circles = circles[0]
+    circles[:, 0] += half_w - margin
+    return circles
 
-    return output
+
+def contour_circles(img_thresh):
+    """
+    Finds the eyeball as the circle best fitting the outline of the largest
+    blob in a thresholded image. This is a single contour pass instead of a
+    Hough search, and returns data in the same format as hough_circles. If no
+    blob is found, the empty list is returned.
+    :param np.ndarray img_thresh: Thresholded image to search.
+    :returns: List of lists of the form [x, y, radius]
+    :rtype: list[list[int]]
+    """
+    # OpenCV 3 returns an extra leading image from findContours.
+    contours = cv.findContours(img_thresh, cv.RETR_EXTERNAL,
+                               cv.CHAIN_APPROX_SIMPLE)[-2]
+    if not contours:
+        return []
+
+    # Least-squares circle through the outline points. The minimum enclosing
+    # circle would be dragged outward by the very notch we want to keep.
+    pts = _as_array(max(contours, key=cv.contourArea))
+    pts = pts.reshape(-1, 2).astype(np.float64)
+    a = np.column_stack((pts, np.ones(len(pts))))
+    b = (pts ** 2).sum(axis=1)
+    (a_x, a_y, c), _, _, _ = np.linalg.lstsq(a, b, rcond=-1)
+    x, y = a_x / 2.0, a_y / 2.0
+    r = math.sqrt(max(c + x ** 2 + y ** 2, 0.0))
+    return [[int(round(x)), int(round(y)), int(round(r))]]
+
+
+def eye_circles(img, img_thresh, method="contour"):
+    """
+    Finds the circle covering the whole eyeball, in the list format returned
+    by hough_circles.
+    :param np.ndarray img: The image to search for circles.
+    :param np.ndarray img_thresh: Thresholded version of img.
+    :param str method: "contour" for contour_circles, which is much cheaper,
+        or "hough" for the tunable hough_circles.
+    :rtype: list[list[int]]
+    """
+    if method == "hough":
+        return hough_circles(img)
+    return contour_circles(img_thresh)
 
 
-def bb_resize(img, img_thresh):
+def bb_resize(img, interpolation=cv.INTER_AREA):
     """
     Resizes an image using bounding boxes. This is done by thresholding the
     image and then calculating its bounding box. The shorter dimension of the
     bounding box is then expanded (with black pixels) to make the bounding box
     square. The pixels in the bounding box are moved to a new image, which is
-    then resized to a standard resolution.
+    then resized to a standard resolution. The output is a reused buffer and
+    will be overwritten by the next call in the same thread.
 
     This effect of this process should be that any eyeball image is roughly
     centered at the same position and about the same size. This is important for
     notch detection so that a small square can be placed approximately over
     where the notch should be in a standardized image.
+    :param np.ndarray img: The image to resize.
+    :param int interpolation: OpenCV interpolation flag for the final resize.
+    :rtype: np.ndarray
     """
-    x, y, w, h = cv.boundingRect(img_thresh)
+    # Separate scratch slot from the STD_RES thresholds of the rest of the
+    # pipeline, so neither keeps evicting the other.
+    x, y, w, h = cv.boundingRect(threshold(img, "bb_threshold"))
 
     # If no bounding rectangle was able to be formed, then the image is
     # probably completely unusable. Simply resize to standard resolution and
     # move on.
+    img_resize = None if isinstance(img, cv.UMat) else \
+        _buf("resize", (STD_RES, STD_RES) + img.shape[2:], img.dtype)
     if (w == 0) or (h == 0):
-        return cv.resize(img, (STD_RES, STD_RES), interpolation=cv.INTER_AREA)
+        return cv.resize(img, (STD_RES, STD_RES), dst=img_resize,
+                         interpolation=interpolation)
 
     # Destination canvas is square, length of max dimension of the bb.
     max_wh = max(w, h)
-    img_expand = np.zeros((max_wh, max_wh), dtype=np.uint8)
 
-    # Copy the bounding box (region of interest) into the center of the
-    # destination canvas. This will produce black bars on the short side.
+    # Pad the bounding box (region of interest) out to the square canvas so it
+    # sits in the center. This will produce black bars on the short side.
     diff_w = max_wh - w
     diff_h = max_wh - h
-    half_dw = int(math.floor(diff_w / 2.0))
-    half_dh = int(math.floor(diff_h / 2.0))
-    roi = img[y:y + h, x:x + w]
-    img_expand[half_dh:(half_dh + h), half_dw:(half_dw + w)] = roi
+    half_dw = diff_w // 2
+    half_dh = diff_h // 2
+    # copyMakeBorder allocates, fills the border and copies in one go.
+    roi = _roi(img, x, y, w, h)
+    img_expand = cv.copyMakeBorder(roi,
+                                   half_dh, diff_h - half_dh,
+                                   half_dw, diff_w - half_dw,
+                                   cv.BORDER_CONSTANT, value=0)
 
     # Resize to our standard resolution.
-    return cv.resize(img_expand, (STD_RES, STD_RES), interpolation=cv.INTER_AREA)
+    return cv.resize(img_expand, (STD_RES, STD_RES), dst=img_resize,
+                     interpolation=interpolation)
 
 
-def detect_notch(img, img_thresh):
+def detect_notch(img, img_thresh, method="contour"):
     """
     Detects if a notch is present in the image, and if so, returns True.
 
-    First, the Hough Circle Transform is applied to find a circle corresponding
-    to the entire eyeball. This circle is subtracted from the thresholded
-    image of the eyeball. Ideally what is left at this point will be either
-    a notch, or nothing. Since we will likely pick up "shreds" left from the
-    edges of the subtraction, we contract and dilate at this point to remove
-    leftovers.
+    First, a circle corresponding to the entire eyeball is found (see
+    eye_circles for the available methods). This circle is subtracted from the
+    thresholded image of the eyeball. Ideally what is left at this point will
+    be either a notch, or nothing. Since we will likely pick up "shreds" left
+    from the edges of the subtraction, we contract and dilate at this point to
+    remove leftovers.
 
     A region of interest is positioned over where notches appear usually,
     which is at about the 45 degree mark on the eyeball in the NE quadrant.
     Blob detection is run over this ROI. If a blob is detected, it is assumed
     that the blob is a notch, and the function can return True.
     """
-    circles = hough_circles(img)
+    # If no circles are detected, fail fast and just return false.
+    found = _notch_roi(img, img_thresh, method)
+    if found is None:
+        return False
+
+    # Run blob detection on what's left. If keypoints were found, then we
+    # assume that a notch was detected.
+    roi, _ = found
+    return bool(_SBD.detect(roi))
+
+
+def _notch_roi(img, img_thresh, method="contour"):
+    """
+    Subtracts the eyeball circle from a copy of img_thresh, cleans up what is
+    left and cuts out the region of interest where a notch would be. This is
+    the whole threshold/circle/cleanup chain of detect_notch, shared with
+    experiment_notch_detection so the two can't drift apart.
+    :param np.ndarray img: The image to search for the eyeball.
+    :param np.ndarray img_thresh: Thresholded version of img.
+    :param str method: Circle finding method, see eye_circles.
+    :returns: The ROI and its (x, y, size) square in img, or None if no
+        eyeball circle was found.
+    :rtype: (np.ndarray, (int, int, int)) | None
+    """
+    circles = eye_circles(img, img_thresh, method)
+    if not circles:
+        return None
 
     # Paint out the first circle detected. Assume that only one circle was
-    # detected for whole image. If no circles are detected, fail fast and just
-    # return false.
-    if circles:
-        x, y, r = circles[0]
-        cv.circle(img_thresh, (x, y), r, (0, 0, 0), cv.FILLED)
-    else:
-        return False
+    # detected for whole image. This happens on a host-side copy so the
+    # caller's mask is left alone.
+    img_thresh = _as_array(img_thresh).copy()
+    x, y, r = circles[0]
+    cv.circle(img_thresh, (x, y), r, (0, 0, 0), cv.FILLED)
 
-    # Erode what's left to try and remove edges.
-    img_thresh = cv.erode(img_thresh, np.ones((3, 3), np.uint8))
-    img_thresh = cv.dilate(img_thresh, np.ones((3, 3), np.uint8))
+    # Open (erode, then dilate) what's left to try and remove edges.
+    cv.morphologyEx(img_thresh, cv.MORPH_OPEN, _KERNEL3, dst=img_thresh)
 
     # Extract a region of interest that is very likely to contain the notch if
     # one is present in the image. This corresponds to a small square at about
@@ -276,26 +551,24 @@ def detect_notch(img, img_thresh):
 
     # Get the damned ROI.
     x, y = (int(radius + side - half_rs), int(radius - side - half_rs))
-    roi = img_thresh[y:int(y + roi_size), x:int(x + roi_size)]
-
-    # Run blob detection on what's left.
-    sbd = cv.SimpleBlobDetector_create(BLOB_PARAMS)
-    keypoints = sbd.detect(roi)
-
-    # If keypoints were found, then we assume that a notch was detected.
-    return bool(keypoints)
+    roi_size = int(roi_size)
+    roi = img_thresh[y:y + roi_size, x:x + roi_size]
+    return roi, (x, y, roi_size)
 
 
 def draw_hough_circles(img, circles):
     """
-    Creates new image from img with circles drawn over it. Will convert the
-    output image to RGB space.
+    Draws circles over a copy of img. Will convert the output image to RGB
+    space. The output is a reused buffer and will be overwritten by the next
+    call in the same thread, so callers must not hold on to it.
     :param np.ndarray img:
-    :param list[(int, int, float)] circles: Detected circles.
+    :param list[list[int]] circles: Detected circles.
     :rtype: np.ndarray
     """
     if circles:
-        output = cv.cvtColor(img.copy(), cv.COLOR_GRAY2RGB)
+        output = None if isinstance(img, cv.UMat) else \
+            _buf("rgb", img.shape + (3,), img.dtype)
+        output = cv.cvtColor(img, cv.COLOR_GRAY2RGB, dst=output)
         for c in circles:
             x, y, r = c
             cv.circle(output, (x, y), r, (0, 0, 255), 2)
@@ -310,7 +583,7 @@ def experiment_threshold(path):
     Launches experiment window for thresholding.
     :param str path: Path to the experiment image file.
     """
-    img = load_image(path)
+    img = load_image(path, cache=True, shrink=True)
     _, thresh_img = cv.threshold(img, THRESH, 255, cv.THRESH_BINARY)
 
     # Image windows for this experiment.
@@ -339,7 +612,7 @@ def experiment_hough(path):
     :param str path: Path to the experiment image file.
     """
     # Threshold the image first to get rid of pesky noise.
-    img = load_image(path)
+    img = load_image(path, cache=True, shrink=True)
 
     # Image windows for this experiment.
     t_window = "Hough Circle Transform Experiment"
@@ -373,7 +646,7 @@ def experiment_hough(path):
 
 
 def experiment_edge_detect(path):
-    img = load_image(path)
+    img = load_image(path, cache=True, shrink=True)
     img = threshold(img)
     edges = cv.Canny(img, LOW_THRESH, MAX_THRESH, apertureSize=KERNEL)
 
@@ -385,7 +658,7 @@ def experiment_edge_detect(path):
     def low_thresh_callback(pos):
         global LOW_THRESH
         LOW_THRESH = pos
-        edges = cv.Canny(img, LOW_THRESH, MAX_THRESH, apertureSize=KERNEL)
+        cv.Canny(img, LOW_THRESH, MAX_THRESH, edges=edges, apertureSize=KERNEL)
         cv.imshow(t_window, edges)
         return
 
@@ -394,56 +667,31 @@ def experiment_edge_detect(path):
     cv.waitKey(0)
 
 
-def experiment_notch_detection(path):
+def experiment_notch_detection(path, method="contour"):
     """ Notch detection via circle subtraction and blob detection. """
-    # Get thresholded image and hough circles.
-    img = load_image(path)
+    # Get thresholded image, subtract the eyeball circle and cut out the ROI.
+    img = load_image(path, cache=True, shrink=True)
     img_thresh = threshold(img)
-    circles = hough_circles(img)
-
-    # Paint out the first circle detected. Assume that only one circle was
-    # detected for whole image.
-    x, y, r = circles[0]
-    cv.circle(img_thresh, (x, y), r, (0, 0, 0), cv.FILLED)
-
-    # Erode what's left to try and remove edges.
-    img_thresh = cv.erode(img_thresh, np.ones((3, 3), np.uint8))
-    img_thresh = cv.dilate(img_thresh, np.ones((3, 3), np.uint8))
+    found = _notch_roi(img, img_thresh, method)
 
-    # Extract a region of interest that is very likely to contain the notch if
-    # one is present in the image. This corresponds to a small square at about
-    # the 45 degree mark on the eyeball. Some notches are slightly lower than
-    # this, so the ROI should be large enough to capture many notch positions.
-    ratio = 1.0 / 4.0
-    roi_size = img_thresh.shape[0] * ratio
-    half_rs = roi_size / 2.0
+    # Image windows for this experiment.
+    o_window = "Original Image"
+    t_window = "Thresholded, Subtracted, Blob-Detected"
+    cv.namedWindow(o_window, cv.WINDOW_AUTOSIZE)
 
-    # Do a little trig to find cartesian coordinates of 45 degrees point.
-    radius = img_thresh.shape[0] / 2.0
-    angle = math.pi / 4.0
-    side = radius * math.sin(angle)
+    # Without an eyeball circle there is nothing to subtract, so just show
+    # the image that was loaded.
+    if found is None:
+        print "No eyeball circle found in image {}.".format(path.split('/')[-1])
+        cv.imshow(o_window, img)
+        cv.waitKey(0)
+        return
 
-    # Get the damned ROI.
-    x, y = (int(radius + side - half_rs), int(radius - side - half_rs))
-    cv.rectangle(img, (x, y), (x + int(roi_size), y + int(roi_size)), (255, 255, 255))
-    roi = img_thresh[y:int(y + roi_size), x:int(x + roi_size)]
+    roi, (x, y, roi_size) = found
+    cv.rectangle(img, (x, y), (x + roi_size, y + roi_size), (255, 255, 255))
 
     # Run blob detection on what's left.
-    # Set up the detector with default parameters.
-    blob_params = cv.SimpleBlobDetector_Params()
-    blob_params.minThreshold = 0.0
-    blob_params.maxThreshold = THRESH
-    blob_params.thresholdStep = THRESH / 2
-    blob_params.filterByArea = False
-    blob_params.filterByColor = False
-    blob_params.filterByConvexity = False
-    blob_params.filterByInertia = True
-    blob_params.minInertiaRatio = 0.05
-    blob_params.maxInertiaRatio = 1
-    sbd = cv.SimpleBlobDetector_create(blob_params)
-
-    # Detect blobs.
-    keypoints = sbd.detect(roi)
+    keypoints = _SBD.detect(roi)
 
     # Draw circles around any detected blobs.
     # cv.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS ensures the size of the circle
@@ -452,10 +700,6 @@ def experiment_notch_detection(path):
                            (0, 0, 255),
                            cv.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS)
 
-    # Image windows for this experiment.
-    o_window = "Original Image"
-    t_window = "Thresholded, Subtracted, Blob-Detected"
-    cv.namedWindow(o_window, cv.WINDOW_AUTOSIZE)
     cv.namedWindow(t_window, cv.WINDOW_AUTOSIZE)
     cv.imshow(o_window, img)
     cv.imshow(t_window, roi)
@@ -467,22 +711,8 @@ def experiment_bounding_box(path):
     """ Bounding box resizing experiment. """
 
     # Calculate initial bounding box via thresholded image.
-    img = load_image(path, resize=False)
-    img_thresh = threshold(img)
-    x, y, w, h = cv.boundingRect(img_thresh)
-
-    max_wh = max(w, h)
-    diff_w = max_wh - w
-    diff_h = max_wh - h
-    half_dw = int(math.floor(diff_w / 2.0))
-    half_dh = int(math.floor(diff_h / 2.0))
-    img_expand = np.zeros((max_wh, max_wh), dtype=np.uint8)
-    roi = img[y:y + h, x:x + w]
-    img_expand[half_dh:(half_dh + h), half_dw:(half_dw + w)] = roi
-
-    img_resize = cv.resize(img_expand,
-                           (STD_RES, STD_RES),
-                           interpolation=cv.INTER_AREA)
+    img = load_image(path, resize=False, cache=True)
+    img_resize = bb_resize(img)
 
     r_window = "Resized Image"
     cv.namedWindow(r_window, cv.WINDOW_AUTOSIZE)
@@ -491,17 +721,72 @@ def experiment_bounding_box(path):
     cv.waitKey(0)
 
 
+def _init_worker():
+    """
+    Pool initializer for the batch run in __main__. Sets up OpenCV and the
+    decoding threads once per worker process instead of lazily on the
+    worker's first image or chunk.
+    """
+    global _DECODER
+
+    # Each worker process already owns a core; keep OpenCV's internal thread
+    # pool from oversubscribing the machine on top of that.
+    cv.setNumThreads(1)
+    cv.ocl.setUseOpenCL(USE_OCL)
+
+    # A throwaway call makes OpenCV set up its dispatch tables now.
+    cv.threshold(np.zeros((8, 8), np.uint8), THRESH, 255, cv.THRESH_BINARY)
+
+    # Shared by every chunk the worker gets, see _process_files.
+    _DECODER = ThreadPool(PREFETCH)
+
+
+def _process_files(jobs):
+    """
+    Pool worker for the batch run in __main__. Preprocesses a chunk of images
+    and writes each result to its output path. The worker's decoding threads
+    (see _init_worker) decode the next images while the current one is
+    processed, so file reads and JPEG decoding overlap with the
+    preprocessing.
+    :param list[(str, str)] jobs: Input and output image paths.
+    :returns: Number of images written.
+    :rtype: int
+    """
+    pending = deque()
+
+    def write_oldest():
+        (path, output), decoded = pending.popleft()
+        cv.imwrite(output, preprocess_image(path, decoded.get()))
+
+    for job in jobs:
+        pending.append((job, _DECODER.apply_async(read_image, (job[0],))))
+        if len(pending) > PREFETCH:
+            write_oldest()
+    while pending:
+        write_oldest()
+
+    return len(jobs)
+
+
 if __name__ == "__main__":
-    import os
     dir_path = "D:/ml/train"
     output_path = "D:/ml/train/output"
 
     if not os.path.exists(output_path):
         os.mkdir(output_path)
 
-    for file_name in os.listdir(dir_path):
-        if "jpeg" in file_name:
-            path = "{}/{}".format(dir_path, file_name)
-            output = "{}/{}".format(output_path, file_name)
-            new_img = preprocess_image(path)
-            cv.imwrite(output, new_img)
+    jobs = [("{}/{}".format(dir_path, file_name),
+             "{}/{}".format(output_path, file_name))
+            for file_name in os.listdir(dir_path)
+            if file_name.lower().endswith((".jpeg", ".jpg"))]
+    chunks = [jobs[i:i + CHUNK_SIZE] for i in range(0, len(jobs), CHUNK_SIZE)]
+
+    # Every image is independent, so spread the batch across all cores.
+    pool = multiprocessing.Pool(multiprocessing.cpu_count(),
+                                initializer=_init_worker)
+    try:
+        for _ in pool.imap_unordered(_process_files, chunks):
+            pass
+    finally:
+        pool.close()
+        pool.join()